@@ -1,27 +1,39 @@
-import re
+import time
+import asyncio
 import logging
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils import executor
-from aiogram.utils.exceptions import TelegramAPIError
+from aiogram.utils.exceptions import TelegramAPIError, BotBlocked, ChatNotFound, UserDeactivated
 
 from database import Database
-from config import BOT_TOKEN, DB_FILE, ADMIN_IDS, TIKTOK_URL_REGEX
+from throttling import LimitedBot
+from storage import SQLiteStorage
+from config import (BOT_TOKEN, DB_FILE, ADMIN_IDS, TIKTOK_URL_PATTERN, TIKTOK_URL_PREFIXES, LOG_LEVEL,
+                    SEED_TEST_DATA, ANNOUNCEMENT_CHANNEL_ID)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Initialize database
+db = Database(DB_FILE, admin_ids=ADMIN_IDS)
+pool = db.pool
+read_pool = db.read_pool
+
 # Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(bot)
-dp.middleware.setup(LoggingMiddleware())
+# All outgoing requests are smoothed to stay within Telegram's rate limits
+bot = LimitedBot(token=BOT_TOKEN)
+# Conversation states survive restarts in the same database
+storage = SQLiteStorage(pool)
+dp = Dispatcher(bot, storage=storage)
 
-# Initialize database
-db = Database(DB_FILE)
+# Logging every update is only useful while debugging
+if LOG_LEVEL == "DEBUG":
+    dp.middleware.setup(LoggingMiddleware())
 
 # Define states for conversation
 class BotStates(StatesGroup):
@@ -33,10 +45,67 @@ class BotStates(StatesGroup):
     waiting_for_admin_level = State()
 
 
+# How often buffered last_action timestamps are written to the database
+LAST_ACTION_FLUSH_INTERVAL = 5  # seconds
+# How often the query planner statistics are refreshed
+ANALYZE_INTERVAL = 60 * 60  # seconds
+
+# Admin panel keyboards never change, so they are built once at import time
+ADMIN_MAIN_KB = InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("👥 Пользователи", callback_data="admin_users"),
+    InlineKeyboardButton("🎬 Очередь", callback_data="admin_queue"),
+    InlineKeyboardButton("⚙️ Настройки", callback_data="admin_settings"),
+    InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")
+)
+ADMIN_USERS_KB = InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("👑 Добавить админа", callback_data="admin_add_admin"),
+    InlineKeyboardButton("🔄 Сбросить лайки", callback_data="admin_reset_likes"),
+    InlineKeyboardButton("➕ Добавить очки", callback_data="admin_add_points"),
+    InlineKeyboardButton("🔼 Изменить уровень", callback_data="admin_set_level"),
+    InlineKeyboardButton("🚫 Заблокировать", callback_data="admin_block_user"),
+    InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
+)
+ADMIN_QUEUE_KB = InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("🗑️ Удалить видео", callback_data="admin_delete_video"),
+    InlineKeyboardButton("🧹 Очистить очередь", callback_data="admin_clear_queue"),
+    InlineKeyboardButton("📢 Объявление", callback_data="admin_announcement"),
+    InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
+)
+ADMIN_SETTINGS_KB = InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("🔢 Лайки для публикации", callback_data="admin_set_likes_required"),
+    InlineKeyboardButton("⏱️ Таймаут спама", callback_data="admin_set_spam_timeout"),
+    InlineKeyboardButton("⭐ Очки за лайк", callback_data="admin_set_points_per_like"),
+    InlineKeyboardButton("🎬 Очки за видео", callback_data="admin_set_points_per_submission"),
+    InlineKeyboardButton("📈 Порог уровня", callback_data="admin_set_level_threshold"),
+    InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
+)
+ADMIN_BACK_KB = InlineKeyboardMarkup().add(
+    InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
+)
+ADMIN_CLEAR_CONFIRM_KB = InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("✅ Да, очистить", callback_data="admin_confirm_clear"),
+    InlineKeyboardButton("❌ Отмена", callback_data="admin_back")
+)
+
+# Commands taken away from blocked users
+BLOCK_CMDS = ('start', 'submit', 'like', 'queue', 'status', 'leaderboard')
+
+# How many announcement messages may be in flight at once
+ANNOUNCEMENT_CONCURRENCY = 25
+# How many recipients may wait for a free sender
+ANNOUNCEMENT_QUEUE_SIZE = 1000
+# Header put in front of every announcement text
+ANNOUNCEMENT_PREFIX = "📢 ОБЪЯВЛЕНИЕ\n\n"
+
+# Last time each (user_id, command) pair was accepted, by time.monotonic()
+_last_cmd = {}
+
+
 # Helper functions
 def is_valid_tiktok_url(url):
     """Check if the URL is a valid TikTok URL"""
-    return bool(re.match(TIKTOK_URL_REGEX, url))
+    # The prefix check turns away most garbage without running the regex
+    return url.startswith(TIKTOK_URL_PREFIXES) and TIKTOK_URL_PATTERN.match(url) is not None
 
 
 def get_user_mention(user):
@@ -47,38 +116,113 @@ def get_user_mention(user):
         return f"[{user.first_name}](tg://user?id={user.id})"
 
 
+async def answer_callback_with(callback_query, response, text=None):
+    """Send a response to a callback concurrently with answering the callback query"""
+    results = await asyncio.gather(
+        response,
+        bot.answer_callback_query(callback_query.id, text),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"Failed to respond to callback {callback_query.data}: {result}")
+
+
 async def check_spam(message: types.Message, command: str):
     """Check if a user is spamming commands"""
+    global _last_cmd
     user_id = message.from_user.id
     
     # Admins bypass spam protection
-    if user_id in ADMIN_IDS or db.is_admin(user_id):
+    if db.is_admin(user_id):
         return False
     
-    if not db.can_execute_command(user_id, command):
+    timeout = db.get_setting('spam_timeout')
+    now = time.monotonic()
+    key = (user_id, command)
+    
+    if db.is_blocked(user_id) or now - _last_cmd.get(key, float('-inf')) <= timeout:
         await message.reply("Пожалуйста, не отправляйте команды слишком часто.")
         return True
     
-    db.record_command(user_id, command)
+    # Forget entries that can no longer trigger the timeout
+    if len(_last_cmd) > 10000:
+        _last_cmd = {k: v for k, v in _last_cmd.items() if now - v <= timeout}
+    
+    _last_cmd[key] = now
     return False
 
 
+async def set_state_with_data(state: FSMContext, new_state, **data):
+    """Move an FSM context to a new state and store data with it in one storage write"""
+    await state.storage.set_state_with_data(chat=state.chat, user=state.user, state=new_state, data=data)
+
+
+async def send_announcement(user_id, text, post=None):
+    """Send an announcement to one user, returning whether it was delivered"""
+    try:
+        if post:
+            # Copying the channel post only passes its ids instead of the whole text
+            await bot.copy_message(user_id, post.chat.id, post.message_id)
+        else:
+            # Sent as plain text: admin input may contain stray Markdown characters
+            await bot.send_message(user_id, text)
+        return True
+    except (BotBlocked, ChatNotFound, UserDeactivated) as e:
+        logging.info(f"Announcement not delivered to user {user_id}: {e}")
+    except Exception as e:
+        logging.error(f"Failed to send announcement to user {user_id}: {e}")
+    return False
+
+
+async def broadcast(text):
+    """Send an announcement to all users, returning how many received it"""
+    # Users are read page by page while a fixed set of workers sends,
+    # so only a bounded number of ids is held in memory at any time
+    pending = asyncio.Queue(maxsize=ANNOUNCEMENT_QUEUE_SIZE)
+    sent_count = 0
+    post = None
+    
+    if ANNOUNCEMENT_CHANNEL_ID:
+        try:
+            post = await bot.send_message(ANNOUNCEMENT_CHANNEL_ID, text)
+        except TelegramAPIError as e:
+            logging.error(f"Failed to post announcement to channel {ANNOUNCEMENT_CHANNEL_ID}: {e}")
+    
+    async def worker():
+        nonlocal sent_count
+        while True:
+            user_id = await pending.get()
+            try:
+                if await send_announcement(user_id, text, post):
+                    sent_count += 1
+            finally:
+                pending.task_done()
+    
+    workers = [asyncio.create_task(worker()) for _ in range(ANNOUNCEMENT_CONCURRENCY)]
+    try:
+        async for user_id in db.iter_user_ids():
+            await pending.put(user_id)
+        await pending.join()
+    finally:
+        for task in workers:
+            task.cancel()
+    
+    return sent_count
+
+
 # Command handlers
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
     """Handle /start command"""
-    logging.info(f"Получена команда /start от пользователя {message.from_user.id}")
-    # остальной код функции
     if await check_spam(message, 'start'):
         return
     
+    logging.info("Получена команда /start от пользователя %s", message.from_user.id)
     user = message.from_user
-    db.add_user(user.id, user.username, user.first_name, user.last_name)
-    db.update_user_last_action(user.id)
-    
-    # Set admin status if user ID is in ADMIN_IDS
-    if user.id in ADMIN_IDS and not db.is_admin(user.id):
-        db.set_admin_status(user.id, True)
+    # Admins from ADMIN_IDS get the flag persisted in the same statement
+    await db.add_user(user.id, user.username, user.first_name, user.last_name, is_admin=user.id in ADMIN_IDS)
+    await db.update_user_last_action(user.id)
     
     welcome_text = (
         f"👋 Привет, {get_user_mention(user)}!\n\n"
@@ -96,16 +240,16 @@ async def cmd_start(message: types.Message):
 @dp.message_handler(commands=['submit'])
 async def cmd_submit(message: types.Message):
     """Handle /submit command"""
-    logging.info(f"Получена команда /submit от пользователя {message.from_user.id}")
     if await check_spam(message, 'submit'):
         return
     
+    logging.info("Получена команда /submit от пользователя %s", message.from_user.id)
     user_id = message.from_user.id
-    db.update_user_last_action(user_id)
+    await db.update_user_last_action(user_id)
     
     # Check if user can submit a video
-    if not db.can_submit_video(user_id):
-        likes_given = db.get_user(user_id)['likes_given']
+    if not await db.can_submit_video(user_id):
+        likes_given = (await db.get_user(user_id))['likes_given']
         likes_required = db.get_likes_required()
         likes_needed = likes_required - likes_given
         
@@ -120,29 +264,15 @@ async def cmd_submit(message: types.Message):
     if len(command_parts) > 1:
         url = command_parts[1].strip()
         if is_valid_tiktok_url(url):
-            video_id = db.add_video(user_id, url)
-            leveled_up = db.increment_user_submissions(user_id)
+            video_id, new_level, bonus_points = await db.submit_video(user_id, url)
             
             response = f"✅ Ваше видео успешно добавлено в очередь под номером {video_id}!\n" \
                       f"Используйте /queue для просмотра очереди."
             
-            if leveled_up:
-                user_data = db.get_user(user_id)
-                response += f"\n🎉 Поздравляем! Вы достигли уровня {user_data['level']}!"
-                
-                # Add bonus for level up
-                if user_data['level'] > 1:
-                    bonus_points = user_data['level'] * 10
-                    conn = db.connect()
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "UPDATE users SET points = points + ? WHERE user_id = ?",
-                        (bonus_points, user_id)
-                    )
-                    conn.commit()
-                    conn.close()
-                    
-                    response += f"\n💰 Бонус за новый уровень: +{bonus_points} очков!"
+            if new_level:
+                response += f"\n🎉 Поздравляем! Вы достигли уровня {new_level}!"
+            if bonus_points:
+                response += f"\n💰 Бонус за новый уровень: +{bonus_points} очков!"
             
             await message.reply(response)
         else:
@@ -163,14 +293,14 @@ async def cmd_like(message: types.Message):
         return
     
     user_id = message.from_user.id
-    db.update_user_last_action(user_id)
+    await db.update_user_last_action(user_id)
     
     # Check if video ID was provided with command
     command_parts = message.text.split(maxsplit=1)
     if len(command_parts) > 1:
         try:
             video_id = int(command_parts[1].strip())
-            video = db.get_video(video_id)
+            video = await db.get_video(video_id)
             
             if not video:
                 await message.reply(f"❌ Видео с номером {video_id} не найдено в очереди.")
@@ -182,56 +312,26 @@ async def cmd_like(message: types.Message):
                 return
             
             # Check if user has already liked this video
-            if db.has_liked_video(user_id, video_id):
+            if await db.has_liked_video(user_id, video_id):
                 await message.reply(f"❌ Вы уже лайкнули видео #{video_id}.")
                 return
             
-            # Add like and update user stats
-            db.add_like(user_id, video_id)
-            leveled_up = db.increment_user_likes(user_id)
-            
-            response = f"✅ Спасибо! Вы подтвердили лайк для видео #{video_id}."
+            # Record the like, update user stats and grant bonuses in one transaction
+            result = await db.like_video(user_id, video_id)
             
-            if leveled_up:
-                user_data = db.get_user(user_id)
-                response += f"\n🎉 Поздравляем! Вы достигли уровня {user_data['level']}!"
-                
-                # Add bonus for level up
-                if user_data['level'] > 1:
-                    bonus_points = user_data['level'] * 10
-                    conn = db.connect()
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "UPDATE users SET points = points + ? WHERE user_id = ?",
-                        (bonus_points, user_id)
-                    )
-                    conn.commit()
-                    conn.close()
-                    
-                    response += f"\n💰 Бонус за новый уровень: +{bonus_points} очков!"
-            
-            # Check if this is a streak (multiple likes in a row)
-            conn = db.connect()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) as streak 
-                FROM likes 
-                WHERE user_id = ? 
-                AND like_time > datetime('now', '-1 day')
-            """, (user_id,))
-            streak = cursor.fetchone()['streak']
+            if result is None:
+                await message.reply(f"❌ Вы уже лайкнули видео #{video_id}.")
+                return
             
-            if streak > 0 and streak % 5 == 0:  # Bonus every 5 likes in a day
-                streak_bonus = streak // 5 * 15
-                cursor.execute(
-                    "UPDATE users SET points = points + ? WHERE user_id = ?",
-                    (streak_bonus, user_id)
-                )
-                conn.commit()
+            new_level, bonus_points, streak_bonus = result
+            response = f"✅ Спасибо! Вы подтвердили лайк для видео #{video_id}."
+            if new_level:
+                response += f"\n🎉 Поздравляем! Вы достигли уровня {new_level}!"
+            if bonus_points:
+                response += f"\n💰 Бонус за новый уровень: +{bonus_points} очков!"
+            if streak_bonus:
                 response += f"\n🔥 Бонус за серию лайков: +{streak_bonus} очков!"
             
-            conn.close()
-            
             await message.reply(response)
             
         except ValueError:
@@ -254,36 +354,36 @@ async def cmd_queue(message: types.Message):
         return
     
     user_id = message.from_user.id
-    db.update_user_last_action(user_id)
+    await db.update_user_last_action(user_id)
     
-    # Get current queue
-    queue = db.get_queue(limit=10)
+    # Get current queue; the extra row only tells whether there is a next page
+    queue = await db.get_queue(limit=11)
+    has_next = len(queue) > 10
+    queue = queue[:10]
     
     if not queue:
         await message.reply("📋 Очередь пуста. Будьте первым, кто добавит видео!")
         return
     
+    # Fetch which of these videos the user already liked in one query
+    liked_ids = await db.get_liked_video_ids(user_id, [video['id'] for video in queue])
+    
     # Format queue message
-    queue_text = "📋 Текущая очередь видео:\n\n"
+    parts = ["📋 Текущая очередь видео:\n\n"]
     
     for i, video in enumerate(queue):
         username = video['username'] or f"{video['first_name']} {video['last_name']}".strip()
-        liked = "✅" if db.has_liked_video(user_id, video['id']) else "👍"
-        queue_text += f"{i+1}. #{video['id']} от {username}: {video['tiktok_url']} [{liked} {video['likes_count']}]\n\n"
+        liked = "✅" if video['id'] in liked_ids else "👍"
+        parts.append(f"{i+1}. #{video['id']} от {username}: {video['tiktok_url']} [{liked} {video['likes_count']}]\n\n")
     
-    queue_text += (
+    parts.append(
         "Используйте /like [номер] для подтверждения лайка.\n"
         f"Вам нужно лайкнуть {db.get_likes_required()} видео, чтобы добавить своё."
     )
+    queue_text = "".join(parts)
     
     # Add pagination if there are more videos
-    conn = db.connect()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) as count FROM videos")
-    total_videos = cursor.fetchone()['count']
-    conn.close()
-    
-    if total_videos > 10:
+    if has_next:
         keyboard = InlineKeyboardMarkup(row_width=2)
         keyboard.add(
             InlineKeyboardButton("⬅️ Предыдущие", callback_data="queue_prev_0"),
@@ -298,7 +398,7 @@ async def cmd_queue(message: types.Message):
 async def process_queue_pagination(callback_query: types.CallbackQuery):
     """Handle queue pagination"""
     user_id = callback_query.from_user.id
-    db.update_user_last_action(user_id)
+    await db.update_user_last_action(user_id)
     
     action, offset_str = callback_query.data.split('_')[1:]
     offset = int(offset_str)
@@ -308,51 +408,49 @@ async def process_queue_pagination(callback_query: types.CallbackQuery):
     else:  # next
         new_offset = offset
     
-    # Get queue with offset
-    queue = db.get_queue(limit=10, offset=new_offset)
+    # Get queue with offset; the extra row only tells whether there is a next page
+    queue = await db.get_queue(limit=11, offset=new_offset)
+    has_next = len(queue) > 10
+    queue = queue[:10]
     
     if not queue:
         await bot.answer_callback_query(callback_query.id, "Нет больше видео в очереди.")
         return
     
+    # Fetch which of these videos the user already liked in one query
+    liked_ids = await db.get_liked_video_ids(user_id, [video['id'] for video in queue])
+    
     # Format queue message
-    queue_text = f"📋 Очередь видео (с {new_offset + 1}):\n\n"
+    parts = [f"📋 Очередь видео (с {new_offset + 1}):\n\n"]
     
     for i, video in enumerate(queue):
         username = video['username'] or f"{video['first_name']} {video['last_name']}".strip()
-        liked = "✅" if db.has_liked_video(user_id, video['id']) else "👍"
-        queue_text += f"{new_offset + i + 1}. #{video['id']} от {username}: {video['tiktok_url']} [{liked} {video['likes_count']}]\n\n"
+        liked = "✅" if video['id'] in liked_ids else "👍"
+        parts.append(f"{new_offset + i + 1}. #{video['id']} от {username}: {video['tiktok_url']} [{liked} {video['likes_count']}]\n\n")
     
-    queue_text += (
+    parts.append(
         "Используйте /like [номер] для подтверждения лайка.\n"
         f"Вам нужно лайкнуть {db.get_likes_required()} видео, чтобы добавить своё."
     )
+    queue_text = "".join(parts)
     
     # Add pagination buttons
-    conn = db.connect()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) as count FROM videos")
-    total_videos = cursor.fetchone()['count']
-    conn.close()
-    
     keyboard = InlineKeyboardMarkup(row_width=2)
     
     if new_offset > 0:
         prev_offset = max(0, new_offset - 10)
         keyboard.insert(InlineKeyboardButton("⬅️ Предыдущие", callback_data=f"queue_prev_{prev_offset}"))
     
-    if new_offset + 10 < total_videos:
+    if has_next:
         next_offset = new_offset + 10
         keyboard.insert(InlineKeyboardButton("Следующие ➡️", callback_data=f"queue_next_{next_offset}"))
     
-    await bot.edit_message_text(
+    await answer_callback_with(callback_query, bot.edit_message_text(
         queue_text,
         callback_query.from_user.id,
         callback_query.message.message_id,
         reply_markup=keyboard
-    )
-    
-    await bot.answer_callback_query(callback_query.id)
+    ))
 
 
 @dp.message_handler(commands=['status'])
@@ -362,9 +460,9 @@ async def cmd_status(message: types.Message):
         return
     
     user_id = message.from_user.id
-    db.update_user_last_action(user_id)
+    await db.update_user_last_action(user_id)
     
-    user_data = db.get_user(user_id)
+    user_data = await db.get_user(user_id)
     if not user_data:
         await message.reply("❌ Произошла ошибка при получении данных. Пожалуйста, попробуйте /start.")
         return
@@ -373,40 +471,29 @@ async def cmd_status(message: types.Message):
     likes_given = user_data['likes_given']
     can_submit = likes_given >= likes_required
     
-    level_threshold = int(db.get_setting('level_threshold'))
+    level_threshold = db.get_setting('level_threshold')
     points_to_next_level = (user_data['level'] * level_threshold) - user_data['points']
     if points_to_next_level < 0:
         points_to_next_level = 0
     
-    # Get user rank
-    conn = db.connect()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(*) as rank 
-        FROM users 
-        WHERE points > (SELECT points FROM users WHERE user_id = ?)
-    """, (user_id,))
-    rank = cursor.fetchone()['rank'] + 1
-    
-    cursor.execute("SELECT COUNT(*) as count FROM users")
-    total_users = cursor.fetchone()['count']
-    
-    # Get recent activity
-    cursor.execute("""
-        SELECT COUNT(*) as today_likes
-        FROM likes
-        WHERE user_id = ? AND like_time > datetime('now', '-1 day')
-    """, (user_id,))
-    today_likes = cursor.fetchone()['today_likes']
-    
-    cursor.execute("""
-        SELECT COUNT(*) as today_videos
-        FROM videos
-        WHERE user_id = ? AND submission_time > datetime('now', '-1 day')
-    """, (user_id,))
-    today_videos = cursor.fetchone()['today_videos']
-    
-    conn.close()
+    # Get user rank and recent activity in one round-trip
+    async with read_pool.acquire() as conn:
+        async with conn.execute("""
+            SELECT
+                (SELECT COUNT(*) + 1 FROM users
+                 WHERE points > (SELECT points FROM users WHERE user_id = ?)) as rank,
+                (SELECT COUNT(*) FROM users) as total_users,
+                (SELECT COUNT(*) FROM likes
+                 WHERE user_id = ? AND like_time > datetime('now', '-1 day')) as today_likes,
+                (SELECT COUNT(*) FROM videos
+                 WHERE user_id = ? AND submission_time > datetime('now', '-1 day')) as today_videos
+        """, (user_id, user_id, user_id)) as cursor:
+            row = await cursor.fetchone()
+    
+    rank = row['rank']
+    total_users = row['total_users']
+    today_likes = row['today_likes']
+    today_videos = row['today_videos']
     
     # Calculate activity score (0-100%)
     activity_score = min(100, (today_likes * 20) + (today_videos * 30))
@@ -456,37 +543,33 @@ async def cmd_leaderboard(message: types.Message):
         return
     
     user_id = message.from_user.id
-    db.update_user_last_action(user_id)
-    
-    conn = db.connect()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT user_id, username, first_name, last_name, points, level, likes_given, videos_submitted
-        FROM users
-        ORDER BY points DESC
-        LIMIT 10
-    """)
+    await db.update_user_last_action(user_id)
     
-    top_users = cursor.fetchall()
-    conn.close()
+    async with read_pool.acquire() as conn:
+        async with conn.execute("""
+            SELECT user_id, username, first_name, last_name, points, level, likes_given, videos_submitted
+            FROM users
+            ORDER BY points DESC
+            LIMIT 10
+        """) as cursor:
+            top_users = await cursor.fetchall()
     
     if not top_users:
         await message.reply("📊 Таблица лидеров пуста.")
         return
     
-    leaderboard_text = "🏆 Таблица лидеров:\n\n"
+    parts = ["🏆 Таблица лидеров:\n\n"]
     
     for i, user in enumerate(top_users):
         username = user['username'] or f"{user['first_name']} {user['last_name']}".strip()
         medal = "🥇" if i == 0 else "🥈" if i == 1 else "🥉" if i == 2 else f"{i+1}."
         
-        leaderboard_text += (
+        parts.append(
             f"{medal} {username}: {user['points']} очков (уровень {user['level']})\n"
             f"   👍 {user['likes_given']} лайков | 🎬 {user['videos_submitted']} видео\n\n"
         )
     
-    await message.reply(leaderboard_text)
+    await message.reply("".join(parts))
 
 
 # Admin commands
@@ -498,505 +581,240 @@ async def cmd_admin(message: types.Message):
     if not db.is_admin(user_id):
         return
     
-    db.update_user_last_action(user_id)
-    
-    # Create inline keyboard for admin panel
-    keyboard = InlineKeyboardMarkup(row_width=2)
-    keyboard.add(
-        InlineKeyboardButton("👥 Пользователи", callback_data="admin_users"),
-        InlineKeyboardButton("🎬 Очередь", callback_data="admin_queue"),
-        InlineKeyboardButton("⚙️ Настройки", callback_data="admin_settings"),
-        InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")
-    )
-    
-    await message.reply("🔐 Панель администратора:", reply_markup=keyboard)
-
-
-# Admin callback handlers
-@dp.callback_query_handler(lambda c: c.data.startswith('admin_'))
-async def process_admin_callback(callback_query: types.CallbackQuery):
-    """Process admin panel callbacks"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    db.update_user_last_action(user_id)
-    
-    action = callback_query.data.split('_')[1]
-    
-    if action == "users":
-        # Show user management options
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("👑 Добавить админа", callback_data="admin_add_admin"),
-            InlineKeyboardButton("🔄 Сбросить лайки", callback_data="admin_reset_likes"),
-            InlineKeyboardButton("➕ Добавить очки", callback_data="admin_add_points"),
-            InlineKeyboardButton("🔼 Изменить уровень", callback_data="admin_set_level"),
-            InlineKeyboardButton("🚫 Заблокировать", callback_data="admin_block_user"),
-            InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
-        )
-        
-        await bot.edit_message_text(
-            "👥 Управление пользователями:",
-            callback_query.from_user.id,
-            callback_query.message.message_id,
-            reply_markup=keyboard
-        )
-        
-    elif action == "queue":
-        # Show queue management options
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("🗑️ Удалить видео", callback_data="admin_delete_video"),
-            InlineKeyboardButton("🧹 Очистить очередь", callback_data="admin_clear_queue"),
-            InlineKeyboardButton("📢 Объявление", callback_data="admin_announcement"),
-            InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
-        )
-        
-        await bot.edit_message_text(
-            "🎬 Управление очередью:",
-            callback_query.from_user.id,
-            callback_query.message.message_id,
-            reply_markup=keyboard
-        )
-        
-    elif action == "settings":
-        # Show settings options
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("🔢 Лайки для публикации", callback_data="admin_set_likes_required"),
-            InlineKeyboardButton("⏱️ Таймаут спама", callback_data="admin_set_spam_timeout"),
-            InlineKeyboardButton("⭐ Очки за лайк", callback_data="admin_set_points_per_like"),
-            InlineKeyboardButton("🎬 Очки за видео", callback_data="admin_set_points_per_submission"),
-            InlineKeyboardButton("📈 Порог уровня", callback_data="admin_set_level_threshold"),
-            InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
-        )
-        
-        await bot.edit_message_text(
-            "⚙️ Настройки бота:",
-            callback_query.from_user.id,
-            callback_query.message.message_id,
-            reply_markup=keyboard
-        )
-        
-    elif action == "stats":
-        # Show bot statistics
-        conn = db.connect()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) as count FROM users")
-        users_count = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM videos")
-        videos_count = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM likes")
-        likes_count = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT SUM(points) as total FROM users")
-        total_points = cursor.fetchone()['total'] or 0
-        
-        cursor.execute("""
-            SELECT COUNT(*) as count 
-            FROM users 
-            WHERE last_action > datetime('now', '-1 day')
-        """)
-        active_users = cursor.fetchone()['count']
-        
-        cursor.execute("""
-            SELECT COUNT(*) as count 
-            FROM videos 
-            WHERE submission_time > datetime('now', '-1 day')
-        """)
-        new_videos = cursor.fetchone()['count']
-        
-        cursor.execute("""
-            SELECT COUNT(*) as count 
-            FROM likes 
-            WHERE like_time > datetime('now', '-1 day')
-        """)
-        new_likes = cursor.fetchone()['count']
-        
-        conn.close()
-        
-        stats_text = (
-            "📊 Статистика бота:\n\n"
-            f"👥 Пользователей: {users_count}\n"
-            f"🎬 Видео в очереди: {videos_count}\n"
-            f"👍 Всего лайков: {likes_count}\n"
-            f"⭐ Всего очков: {total_points}\n\n"
-            f"📅 Активность за 24 часа:\n"
-            f"👤 Активных пользователей: {active_users}\n"
-            f"🎬 Новых видео: {new_videos}\n"
-            f"👍 Новых лайков: {new_likes}\n\n"
-            f"⚙️ Настройки:\n"
-            f"- Лайков для публикации: {db.get_setting('likes_required')}\n"
-            f"- Очков за лайк: {db.get_setting('points_per_like')}\n"
-            f"- Очков за публикацию: {db.get_setting('points_per_submission')}\n"
-            f"- Порог уровня: {db.get_setting('level_threshold')}\n"
-            f"- Таймаут спама: {db.get_setting('spam_timeout')} сек."
-        )
-        
-        keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("🔙 Назад", callback_data="admin_back"))
-        
-        await bot.edit_message_text(
-            stats_text,
-            callback_query.from_user.id,
-            callback_query.message.message_id,
-            reply_markup=keyboard
-        )
-        
-    elif action == "back":
-        # Return to main admin panel
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("👥 Пользователи", callback_data="admin_users"),
-            InlineKeyboardButton("🎬 Очередь", callback_data="admin_queue"),
-            InlineKeyboardButton("⚙️ Настройки", callback_data="admin_settings"),
-            InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")
-        )
-        
-        await bot.edit_message_text(
-            "🔐 Панель администратора:",
-            callback_query.from_user.id,
-            callback_query.message.message_id,
-            reply_markup=keyboard
-        )
-    
-    # Answer callback query to remove loading indicator
-    await bot.answer_callback_query(callback_query.id)
-
-
-# Admin action handlers
-@dp.callback_query_handler(lambda c: c.data == "admin_delete_video")
-async def admin_delete_video(callback_query: types.CallbackQuery):
-    """Handle admin delete video action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите номер видео, которое нужно удалить из очереди:"
-    )
-    await BotStates.waiting_for_admin_action.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="delete_video")
+    await db.update_user_last_action(user_id)
     
-    await bot.answer_callback_query(callback_query.id)
+    await message.reply("🔐 Панель администратора:", reply_markup=ADMIN_MAIN_KB)
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_clear_queue")
-async def admin_clear_queue(callback_query: types.CallbackQuery):
-    """Handle admin clear queue action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    # Create confirmation keyboard
-    keyboard = InlineKeyboardMarkup(row_width=2)
-    keyboard.add(
-        InlineKeyboardButton("✅ Да, очистить", callback_data="admin_confirm_clear"),
-        InlineKeyboardButton("❌ Отмена", callback_data="admin_back")
-    )
-    
+# Admin panel menus
+async def _admin_show_users(callback_query: types.CallbackQuery):
+    """Show user management options"""
     await bot.edit_message_text(
-        "⚠️ Вы уверены, что хотите очистить всю очередь видео? Это действие нельзя отменить.",
+        "👥 Управление пользователями:",
         callback_query.from_user.id,
         callback_query.message.message_id,
-        reply_markup=keyboard
+        reply_markup=ADMIN_USERS_KB
     )
-    
-    await bot.answer_callback_query(callback_query.id)
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_confirm_clear")
-async def admin_confirm_clear_queue(callback_query: types.CallbackQuery):
-    """Handle admin confirm clear queue action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    # Clear the queue
-    conn = db.connect()
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM likes")
-    cursor.execute("DELETE FROM videos")
-    
-    conn.commit()
-    conn.close()
-    
-    await bot.answer_callback_query(callback_query.id, "Очередь успешно очищена!")
-    
-    # Return to main admin panel
-    keyboard = InlineKeyboardMarkup(row_width=2)
-    keyboard.add(
-        InlineKeyboardButton("👥 Пользователи", callback_data="admin_users"),
-        InlineKeyboardButton("🎬 Очередь", callback_data="admin_queue"),
-        InlineKeyboardButton("⚙️ Настройки", callback_data="admin_settings"),
-        InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")
-    )
-    
+async def _admin_show_queue(callback_query: types.CallbackQuery):
+    """Show queue management options"""
     await bot.edit_message_text(
-        "🔐 Панель администратора:",
+        "🎬 Управление очередью:",
         callback_query.from_user.id,
         callback_query.message.message_id,
-        reply_markup=keyboard
+        reply_markup=ADMIN_QUEUE_KB
     )
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_add_admin")
-async def admin_add_admin(callback_query: types.CallbackQuery):
-    """Handle admin add admin action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите ID пользователя, которого нужно сделать администратором:"
-    )
-    await BotStates.waiting_for_admin_user_id.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="add_admin")
-    
-    await bot.answer_callback_query(callback_query.id)
-
-
-@dp.callback_query_handler(lambda c: c.data == "admin_reset_likes")
-async def admin_reset_likes(callback_query: types.CallbackQuery):
-    """Handle admin reset likes action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите ID пользователя, у которого нужно сбросить счетчик лайков:"
-    )
-    await BotStates.waiting_for_admin_user_id.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="reset_likes")
-    
-    await bot.answer_callback_query(callback_query.id)
-
-
-@dp.callback_query_handler(lambda c: c.data == "admin_add_points")
-async def admin_add_points(callback_query: types.CallbackQuery):
-    """Handle admin add points action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите ID пользователя, которому нужно добавить очки:"
+async def _admin_show_settings(callback_query: types.CallbackQuery):
+    """Show settings options"""
+    await bot.edit_message_text(
+        "⚙️ Настройки бота:",
+        callback_query.from_user.id,
+        callback_query.message.message_id,
+        reply_markup=ADMIN_SETTINGS_KB
     )
-    await BotStates.waiting_for_admin_user_id.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="add_points")
-    
-    await bot.answer_callback_query(callback_query.id)
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_set_level")
-async def admin_set_level(callback_query: types.CallbackQuery):
-    """Handle admin set level action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите ID пользователя, которому нужно изменить уровень:"
+async def _admin_show_stats(callback_query: types.CallbackQuery):
+    """Show bot statistics"""
+    async with read_pool.acquire() as conn:
+        async with conn.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users) as users_count,
+                (SELECT COUNT(*) FROM videos) as videos_count,
+                (SELECT COUNT(*) FROM likes) as likes_count,
+                (SELECT SUM(points) FROM users) as total_points,
+                (SELECT COUNT(*) FROM users
+                 WHERE last_action > datetime('now', '-1 day')) as active_users,
+                (SELECT COUNT(*) FROM videos
+                 WHERE submission_time > datetime('now', '-1 day')) as new_videos,
+                (SELECT COUNT(*) FROM likes
+                 WHERE like_time > datetime('now', '-1 day')) as new_likes
+        """) as cursor:
+            row = await cursor.fetchone()
+    
+    users_count = row['users_count']
+    videos_count = row['videos_count']
+    likes_count = row['likes_count']
+    total_points = row['total_points'] or 0
+    active_users = row['active_users']
+    new_videos = row['new_videos']
+    new_likes = row['new_likes']
+    
+    stats_text = (
+        "📊 Статистика бота:\n\n"
+        f"👥 Пользователей: {users_count}\n"
+        f"🎬 Видео в очереди: {videos_count}\n"
+        f"👍 Всего лайков: {likes_count}\n"
+        f"⭐ Всего очков: {total_points}\n\n"
+        f"📅 Активность за 24 часа:\n"
+        f"👤 Активных пользователей: {active_users}\n"
+        f"🎬 Новых видео: {new_videos}\n"
+        f"👍 Новых лайков: {new_likes}\n\n"
+        f"⚙️ Настройки:\n"
+        f"- Лайков для публикации: {db.get_setting('likes_required')}\n"
+        f"- Очков за лайк: {db.get_setting('points_per_like')}\n"
+        f"- Очков за публикацию: {db.get_setting('points_per_submission')}\n"
+        f"- Порог уровня: {db.get_setting('level_threshold')}\n"
+        f"- Таймаут спама: {db.get_setting('spam_timeout')} сек."
     )
-    await BotStates.waiting_for_admin_user_id.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="set_level")
-    
-    await bot.answer_callback_query(callback_query.id)
-
-
-@dp.callback_query_handler(lambda c: c.data == "admin_block_user")
-async def admin_block_user(callback_query: types.CallbackQuery):
-    """Handle admin block user action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
     
-    await bot.send_message(
-        user_id,
-        "Введите ID пользователя, которого нужно заблокировать:"
+    await bot.edit_message_text(
+        stats_text,
+        callback_query.from_user.id,
+        callback_query.message.message_id,
+        reply_markup=ADMIN_BACK_KB
     )
-    await BotStates.waiting_for_admin_user_id.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="block_user")
-    
-    await bot.answer_callback_query(callback_query.id)
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_announcement")
-async def admin_announcement(callback_query: types.CallbackQuery):
-    """Handle admin announcement action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите текст объявления для всех пользователей:"
+async def _admin_show_main(callback_query: types.CallbackQuery):
+    """Return to main admin panel"""
+    await bot.edit_message_text(
+        "🔐 Панель администратора:",
+        callback_query.from_user.id,
+        callback_query.message.message_id,
+        reply_markup=ADMIN_MAIN_KB
     )
-    await BotStates.waiting_for_admin_action.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="announcement")
-    
-    await bot.answer_callback_query(callback_query.id)
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_set_likes_required")
-async def admin_set_likes_required(callback_query: types.CallbackQuery):
-    """Handle admin set likes required action"""
-    user_id = callback_query.from_user.id
-    
-    if not db.is_admin(user_id):
-        await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
-        return
-    
-    await bot.send_message(
-        user_id,
-        "Введите количество лайков, необходимое для публикации видео:"
-    )
-    await BotStates.waiting_for_admin_action.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="set_likes_required")
-    
-    await bot.answer_callback_query(callback_query.id)
+# Callback data of each admin panel menu and the function that shows it
+ADMIN_MENUS = {
+    "admin_users": _admin_show_users,
+    "admin_queue": _admin_show_queue,
+    "admin_settings": _admin_show_settings,
+    "admin_stats": _admin_show_stats,
+    "admin_back": _admin_show_main,
+}
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_set_spam_timeout")
-async def admin_set_spam_timeout(callback_query: types.CallbackQuery):
-    """Handle admin set spam timeout action"""
+# Admin callback handlers
+@dp.callback_query_handler(lambda c: c.data in ADMIN_MENUS)
+async def process_admin_callback(callback_query: types.CallbackQuery):
+    """Process admin panel navigation callbacks"""
     user_id = callback_query.from_user.id
     
     if not db.is_admin(user_id):
         await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
         return
     
-    await bot.send_message(
-        user_id,
-        "Введите таймаут защиты от спама в секундах:"
-    )
-    await BotStates.waiting_for_admin_action.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="set_spam_timeout")
-    
-    await bot.answer_callback_query(callback_query.id)
+    await db.update_user_last_action(user_id)
+    
+    # Answer callback query to remove loading indicator while the menu is shown
+    await answer_callback_with(callback_query, ADMIN_MENUS[callback_query.data](callback_query))
+
+
+# Callback data of each admin action that asks for input: (prompt, state, action tag)
+ADMIN_ACTIONS = {
+    "admin_delete_video": (
+        "Введите номер видео, которое нужно удалить из очереди:",
+        BotStates.waiting_for_admin_action, "delete_video"
+    ),
+    "admin_add_admin": (
+        "Введите ID пользователя, которого нужно сделать администратором:",
+        BotStates.waiting_for_admin_user_id, "add_admin"
+    ),
+    "admin_reset_likes": (
+        "Введите ID пользователя, у которого нужно сбросить счетчик лайков:",
+        BotStates.waiting_for_admin_user_id, "reset_likes"
+    ),
+    "admin_add_points": (
+        "Введите ID пользователя, которому нужно добавить очки:",
+        BotStates.waiting_for_admin_user_id, "add_points"
+    ),
+    "admin_set_level": (
+        "Введите ID пользователя, которому нужно изменить уровень:",
+        BotStates.waiting_for_admin_user_id, "set_level"
+    ),
+    "admin_block_user": (
+        "Введите ID пользователя, которого нужно заблокировать:",
+        BotStates.waiting_for_admin_user_id, "block_user"
+    ),
+    "admin_announcement": (
+        "Введите текст объявления для всех пользователей:",
+        BotStates.waiting_for_admin_action, "announcement"
+    ),
+    "admin_set_likes_required": (
+        "Введите количество лайков, необходимое для публикации видео:",
+        BotStates.waiting_for_admin_action, "set_likes_required"
+    ),
+    "admin_set_spam_timeout": (
+        "Введите таймаут защиты от спама в секундах:",
+        BotStates.waiting_for_admin_action, "set_spam_timeout"
+    ),
+    "admin_set_points_per_like": (
+        "Введите количество очков за один лайк:",
+        BotStates.waiting_for_admin_action, "set_points_per_like"
+    ),
+    "admin_set_points_per_submission": (
+        "Введите количество очков за одну публикацию видео:",
+        BotStates.waiting_for_admin_action, "set_points_per_submission"
+    ),
+    "admin_set_level_threshold": (
+        "Введите количество очков, необходимое для повышения уровня:",
+        BotStates.waiting_for_admin_action, "set_level_threshold"
+    ),
+}
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_set_points_per_like")
-async def admin_set_points_per_like(callback_query: types.CallbackQuery):
-    """Handle admin set points per like action"""
+# Admin action handlers
+@dp.callback_query_handler(lambda c: c.data in ADMIN_ACTIONS)
+async def admin_request_input(callback_query: types.CallbackQuery, state: FSMContext):
+    """Handle admin actions that ask for input"""
     user_id = callback_query.from_user.id
     
     if not db.is_admin(user_id):
         await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
         return
     
-    await bot.send_message(
-        user_id,
-        "Введите количество очков за один лайк:"
-    )
-    await BotStates.waiting_for_admin_action.set()
+    prompt, bot_state, action = ADMIN_ACTIONS[callback_query.data]
     
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="set_points_per_like")
+    # Store the action type in user data together with the new state
+    await set_state_with_data(state, bot_state, admin_action=action)
     
-    await bot.answer_callback_query(callback_query.id)
+    await answer_callback_with(callback_query, bot.send_message(user_id, prompt))
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_set_points_per_submission")
-async def admin_set_points_per_submission(callback_query: types.CallbackQuery):
-    """Handle admin set points per submission action"""
+@dp.callback_query_handler(lambda c: c.data == "admin_clear_queue")
+async def admin_clear_queue(callback_query: types.CallbackQuery):
+    """Handle admin clear queue action"""
     user_id = callback_query.from_user.id
     
     if not db.is_admin(user_id):
         await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
         return
     
-    await bot.send_message(
-        user_id,
-        "Введите количество очков за одну публикацию видео:"
-    )
-    await BotStates.waiting_for_admin_action.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="set_points_per_submission")
-    
-    await bot.answer_callback_query(callback_query.id)
+    # Ask for confirmation
+    await answer_callback_with(callback_query, bot.edit_message_text(
+        "⚠️ Вы уверены, что хотите очистить всю очередь видео? Это действие нельзя отменить.",
+        callback_query.from_user.id,
+        callback_query.message.message_id,
+        reply_markup=ADMIN_CLEAR_CONFIRM_KB
+    ))
 
 
-@dp.callback_query_handler(lambda c: c.data == "admin_set_level_threshold")
-async def admin_set_level_threshold(callback_query: types.CallbackQuery):
-    """Handle admin set level threshold action"""
+@dp.callback_query_handler(lambda c: c.data == "admin_confirm_clear")
+async def admin_confirm_clear_queue(callback_query: types.CallbackQuery):
+    """Handle admin confirm clear queue action"""
     user_id = callback_query.from_user.id
     
     if not db.is_admin(user_id):
         await bot.answer_callback_query(callback_query.id, "У вас нет прав администратора.")
         return
     
-    await bot.send_message(
-        user_id,
-        "Введите количество очков, необходимое для повышения уровня:"
-    )
-    await BotStates.waiting_for_admin_action.set()
-    
-    # Store the action type in user data
-    state = dp.current_state(user=user_id)
-    await state.update_data(admin_action="set_level_threshold")
+    # Clear the queue; likes of the videos are removed by ON DELETE CASCADE
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM videos")
+        await conn.commit()
     
-    await bot.answer_callback_query(callback_query.id)
+    # Return to main admin panel
+    await answer_callback_with(callback_query, bot.edit_message_text(
+        "🔐 Панель администратора:",
+        callback_query.from_user.id,
+        callback_query.message.message_id,
+        reply_markup=ADMIN_MAIN_KB
+    ), "Очередь успешно очищена!")
 
 
 @dp.message_handler(state=BotStates.waiting_for_admin_user_id)
@@ -1014,7 +832,7 @@ async def process_admin_user_id(message: types.Message, state: FSMContext):
     
     try:
         target_user_id = int(message.text.strip())
-        target_user = db.get_user(target_user_id)
+        target_user = await db.get_user(target_user_id)
         
         if not target_user:
             await message.reply(f"❌ Пользователь с ID {target_user_id} не найден.")
@@ -1022,43 +840,27 @@ async def process_admin_user_id(message: types.Message, state: FSMContext):
             return
         
         if action == "add_admin":
-            db.set_admin_status(target_user_id, True)
+            await db.set_admin_status(target_user_id, True)
             await message.reply(f"✅ Пользователь с ID {target_user_id} теперь администратор.")
             await state.finish()
             
         elif action == "reset_likes":
-            conn = db.connect()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET likes_given = 0 WHERE user_id = ?", (target_user_id,))
-            conn.commit()
-            conn.close()
+            async with pool.acquire() as conn:
+                await conn.execute("UPDATE users SET likes_given = 0 WHERE user_id = ?", (target_user_id,))
+                await conn.commit()
             await message.reply(f"✅ Счетчик лайков пользователя с ID {target_user_id} сброшен.")
             await state.finish()
             
         elif action == "add_points":
             await message.reply(f"Введите количество очков для добавления пользователю с ID {target_user_id}:")
-            await BotStates.waiting_for_admin_points.set()
-            await state.update_data(target_user_id=target_user_id)
+            await set_state_with_data(state, BotStates.waiting_for_admin_points, target_user_id=target_user_id)
             
         elif action == "set_level":
             await message.reply(f"Введите новый уровень для пользователя с ID {target_user_id}:")
-            await BotStates.waiting_for_admin_level.set()
-            await state.update_data(target_user_id=target_user_id)
+            await set_state_with_data(state, BotStates.waiting_for_admin_level, target_user_id=target_user_id)
             
         elif action == "block_user":
-            # Create a spam protection record with a very long timeout
-            conn = db.connect()
-            cursor = conn.cursor()
-            
-            # Block for all common commands
-            for cmd in ['start', 'submit', 'like', 'queue', 'status', 'leaderboard']:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO spam_protection (user_id, command, timestamp) VALUES (?, ?, datetime('now', '+100 years'))",
-                    (target_user_id, cmd)
-                )
-            
-            conn.commit()
-            conn.close()
+            await db.block_user(target_user_id, BLOCK_CMDS)
             
             await message.reply(f"✅ Пользователь с ID {target_user_id} заблокирован.")
             await state.finish()
@@ -1084,29 +886,28 @@ async def process_admin_points(message: types.Message, state: FSMContext):
     try:
         points = int(message.text.strip())
         
-        conn = db.connect()
-        cursor = conn.cursor()
-        
-        # Add points
-        cursor.execute(
-            "UPDATE users SET points = points + ? WHERE user_id = ?",
-            (points, target_user_id)
-        )
+        level_threshold = db.get_setting('level_threshold')
         
-        # Check if user should level up
-        cursor.execute("SELECT points, level FROM users WHERE user_id = ?", (target_user_id,))
-        user = cursor.fetchone()
+        # Add points and level up in one transaction; RETURNING only sees the new row,
+        # so the stored level is read first to tell whether it went up
+        async with pool.acquire() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            
+            async with conn.execute("SELECT level FROM users WHERE user_id = ?", (target_user_id,)) as cursor:
+                old_level = (await cursor.fetchone())['level']
+            
+            async with conn.execute(
+                "UPDATE users SET points = points + ?, level = MAX(level, (points + ?) / ? + 1) "
+                "WHERE user_id = ? RETURNING level",
+                (points, points, level_threshold, target_user_id)
+            ) as cursor:
+                new_level = (await cursor.fetchone())['level']
+            
+            await conn.commit()
         
-        cursor.execute("SELECT value FROM settings WHERE key = 'level_threshold'")
-        level_threshold = int(cursor.fetchone()['value'])
+        leveled_up = new_level > old_level
         
-        new_level = (user['points'] // level_threshold) + 1
-        if new_level > user['level']:
-            cursor.execute(
-                "UPDATE users SET level = ? WHERE user_id = ?",
-                (new_level, target_user_id)
-            )
-            
+        if leveled_up:
             await message.reply(
                 f"✅ Добавлено {points} очков пользователю с ID {target_user_id}.\n"
                 f"🎉 Пользователь повышен до уровня {new_level}!"
@@ -1114,9 +915,6 @@ async def process_admin_points(message: types.Message, state: FSMContext):
         else:
             await message.reply(f"✅ Добавлено {points} очков пользователю с ID {target_user_id}.")
         
-        conn.commit()
-        conn.close()
-        
     except ValueError:
         await message.reply("❌ Пожалуйста, введите корректное количество очков (число).")
     
@@ -1144,17 +942,13 @@ async def process_admin_level(message: types.Message, state: FSMContext):
             await state.finish()
             return
         
-        conn = db.connect()
-        cursor = conn.cursor()
-        
         # Set level
-        cursor.execute(
-            "UPDATE users SET level = ? WHERE user_id = ?",
-            (level, target_user_id)
-        )
-        
-        conn.commit()
-        conn.close()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE users SET level = ? WHERE user_id = ?",
+                (level, target_user_id)
+            )
+            await conn.commit()
         
         await message.reply(f"✅ Уровень пользователя с ID {target_user_id} изменен на {level}.")
         
@@ -1164,6 +958,46 @@ async def process_admin_level(message: types.Message, state: FSMContext):
     await state.finish()
 
 
+# Admin actions that set an integer setting: (key, minimum, error if below minimum, reply template)
+INT_SETTING_ACTIONS = {
+    "set_likes_required": (
+        'likes_required', 0, "❌ Количество лайков не может быть отрицательным.",
+        "✅ Количество лайков для публикации установлено: {}"
+    ),
+    "set_spam_timeout": (
+        'spam_timeout', 0, "❌ Таймаут не может быть отрицательным.",
+        "✅ Таймаут защиты от спама установлен: {} сек."
+    ),
+    "set_points_per_like": (
+        'points_per_like', 0, "❌ Количество очков не может быть отрицательным.",
+        "✅ Количество очков за лайк установлено: {}"
+    ),
+    "set_points_per_submission": (
+        'points_per_submission', 0, "❌ Количество очков не может быть отрицательным.",
+        "✅ Количество очков за публикацию установлено: {}"
+    ),
+    "set_level_threshold": (
+        'level_threshold', 1, "❌ Порог уровня не может быть меньше 1.",
+        "✅ Порог уровня установлен: {} очков"
+    ),
+}
+
+
+async def set_int_setting(message, key, min_value, too_small_text, success_text):
+    """Validate an integer setting typed by an admin and save it"""
+    try:
+        value = int(message.text.strip())
+    except ValueError:
+        await message.reply("❌ Пожалуйста, введите корректное число.")
+        return
+    
+    if value < min_value:
+        await message.reply(too_small_text)
+    else:
+        await db.update_setting(key, value)
+        await message.reply(success_text.format(value))
+
+
 @dp.message_handler(state=BotStates.waiting_for_admin_action)
 async def process_admin_action(message: types.Message, state: FSMContext):
     """Process admin action input"""
@@ -1180,75 +1014,18 @@ async def process_admin_action(message: types.Message, state: FSMContext):
     if action == "delete_video":
         try:
             video_id = int(message.text.strip())
-            video = db.get_video(video_id)
+            video = await db.get_video(video_id)
             
             if not video:
                 await message.reply(f"❌ Видео с номером {video_id} не найдено в очереди.")
             else:
-                db.delete_video(video_id)
+                await db.delete_video(video_id)
                 await message.reply(f"✅ Видео #{video_id} успешно удалено из очереди.")
         except ValueError:
             await message.reply("❌ Пожалуйста, введите корректный номер видео.")
     
-    elif action == "set_likes_required":
-        try:
-            likes_required = int(message.text.strip())
-            
-            if likes_required < 0:
-                await message.reply("❌ Количество лайков не может быть отрицательным.")
-            else:
-                db.update_setting('likes_required', str(likes_required))
-                await message.reply(f"✅ Количество лайков для публикации установлено: {likes_required}")
-        except ValueError:
-            await message.reply("❌ Пожалуйста, введите корректное число.")
-    
-    elif action == "set_spam_timeout":
-        try:
-            spam_timeout = int(message.text.strip())
-            
-            if spam_timeout < 0:
-                await message.reply("❌ Таймаут не может быть отрицательным.")
-            else:
-                db.update_setting('spam_timeout', str(spam_timeout))
-                await message.reply(f"✅ Таймаут защиты от спама установлен: {spam_timeout} сек.")
-        except ValueError:
-            await message.reply("❌ Пожалуйста, введите корректное число.")
-    
-    elif action == "set_points_per_like":
-        try:
-            points = int(message.text.strip())
-            
-            if points < 0:
-                await message.reply("❌ Количество очков не может быть отрицательным.")
-            else:
-                db.update_setting('points_per_like', str(points))
-                await message.reply(f"✅ Количество очков за лайк установлено: {points}")
-        except ValueError:
-            await message.reply("❌ Пожалуйста, введите корректное число.")
-    
-    elif action == "set_points_per_submission":
-        try:
-            points = int(message.text.strip())
-            
-            if points < 0:
-                await message.reply("❌ Количество очков не может быть отрицательным.")
-            else:
-                db.update_setting('points_per_submission', str(points))
-                await message.reply(f"✅ Количество очков за публикацию установлено: {points}")
-        except ValueError:
-            await message.reply("❌ Пожалуйста, введите корректное число.")
-    
-    elif action == "set_level_threshold":
-        try:
-            threshold = int(message.text.strip())
-            
-            if threshold < 1:
-                await message.reply("❌ Порог уровня не может быть меньше 1.")
-            else:
-                db.update_setting('level_threshold', str(threshold))
-                await message.reply(f"✅ Порог уровня установлен: {threshold} очков")
-        except ValueError:
-            await message.reply("❌ Пожалуйста, введите корректное число.")
+    elif action in INT_SETTING_ACTIONS:
+        await set_int_setting(message, *INT_SETTING_ACTIONS[action])
     
     elif action == "announcement":
         announcement_text = message.text.strip()
@@ -1256,26 +1033,12 @@ async def process_admin_action(message: types.Message, state: FSMContext):
         if not announcement_text:
             await message.reply("❌ Текст объявления не может быть пустым.")
         else:
-            # Get all users
-            conn = db.connect()
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM users")
-            users = cursor.fetchall()
-            conn.close()
-            
-            sent_count = 0
+            # Leave the state first: a broadcast takes minutes, and further messages
+            # from the admin must not start another one meanwhile
+            await state.finish()
             
-            # Send announcement to all users
-            for user in users:
-                try:
-                    await bot.send_message(
-                        user['user_id'],
-                        f"📢 ОБЪЯВЛЕНИЕ\n\n{announcement_text}",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    sent_count += 1
-                except Exception as e:
-                    logging.error(f"Failed to send announcement to user {user['user_id']}: {e}")
+            # Send announcement to all users concurrently; the bot paces the actual requests
+            sent_count = await broadcast(ANNOUNCEMENT_PREFIX + announcement_text)
             
             await message.reply(f"✅ Объявление отправлено {sent_count} пользователям.")
     
@@ -1296,11 +1059,42 @@ async def error_handler(update, exception):
     return True
 
 
+async def flush_last_actions_periodically():
+    """Periodically write buffered user activity timestamps"""
+    while True:
+        await asyncio.sleep(LAST_ACTION_FLUSH_INTERVAL)
+        try:
+            await db.flush_last_actions()
+        except Exception as e:
+            logging.error(f"Failed to flush last action timestamps: {e}")
+
+
+async def analyze_db_periodically():
+    """Periodically refresh the query planner statistics"""
+    while True:
+        await asyncio.sleep(ANALYZE_INTERVAL)
+        try:
+            await db.analyze()
+        except Exception as e:
+            logging.error(f"Failed to analyze the database: {e}")
+
+
 # Main function to start the bot
 async def on_startup(dp):
     """Actions to perform on startup"""
     logging.info("Starting bot...")
     
+    # Create tables and default settings
+    await db.init_db()
+    await storage.load()
+    
+    if SEED_TEST_DATA and await db.seed_test_data(ADMIN_IDS[0] if ADMIN_IDS else 123456789):
+        logging.info("Test videos added to the queue")
+    
+    # Keep a reference so the task is not garbage collected
+    dp['last_action_flusher'] = asyncio.create_task(flush_last_actions_periodically())
+    dp['db_analyzer'] = asyncio.create_task(analyze_db_periodically())
+    
     # Set default commands
     await dp.bot.set_my_commands([
         types.BotCommand("start", "Начать работу с ботом"),
@@ -1313,5 +1107,15 @@ async def on_startup(dp):
     ])
 
 
+async def on_shutdown(dp):
+    """Actions to perform on shutdown"""
+    tasks = (dp['last_action_flusher'], dp['db_analyzer'])
+    for task in tasks:
+        task.cancel()
+    # Let a cancelled flush put its batch back before the final flush runs
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await db.close()
+
+
 if __name__ == '__main__':
-    executor.start_polling(dp, on_startup=on_startup, skip_updates=True)
+    executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown, skip_updates=True)
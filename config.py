@@ -1,16 +1,34 @@
 import os
+import re
+import queue
+import atexit
 import logging
+import logging.handlers
 from dotenv import load_dotenv
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_file_handler = logging.handlers.RotatingFileHandler(
+    "bot.log", maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8", delay=True
 )
+_log_console_handler = logging.StreamHandler()
+for _handler in (_log_file_handler, _log_console_handler):
+    _handler.setFormatter(_log_formatter)
+
+# В файл записи попадают пачками; ошибки сбрасывают буфер сразу
+_log_handlers = [
+    logging.handlers.MemoryHandler(1000, flushLevel=logging.ERROR, target=_log_file_handler),
+    _log_console_handler
+]
+
+# Записи пишутся в файл и консоль из отдельного потока, чтобы не блокировать event loop
+_log_queue = queue.SimpleQueue()
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 # Загрузка переменных окружения из .env файла
 load_dotenv()
@@ -22,6 +40,15 @@ ADMIN_IDS = [int(id.strip()) for id in os.getenv("ADMIN_IDS", "").split(",") if
 
 # Настройки для проверки TikTok URL
 TIKTOK_URL_REGEX = r'https?://(www\.)?(tiktok\.com|vm\.tiktok\.com)/(@[\w\.]+/video/\d+|t/[\w]+)'
+# Скомпилировано один раз; имена пользователей и ID видео в TikTok только ASCII
+TIKTOK_URL_PATTERN = re.compile(TIKTOK_URL_REGEX, re.ASCII)
+# Все начала ссылок, которые допускает регулярное выражение, для быстрой проверки
+TIKTOK_URL_PREFIXES = tuple(
+    f"{scheme}://{www}{host}/"
+    for scheme in ("http", "https")
+    for www in ("", "www.")
+    for host in ("tiktok.com", "vm.tiktok.com")
+)
 
 # Настройки по умолчанию
 DEFAULT_LIKES_REQUIRED = 3
@@ -35,8 +62,15 @@ PORT = int(os.getenv("PORT", 8080))
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
 USE_WEBHOOK = os.getenv("USE_WEBHOOK", "False").lower() == "true"
 
-# Настройки для логирования
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Добавить тестовые видео в новую базу (выполняется только один раз)
+SEED_TEST_DATA = os.getenv("SEED_TEST_DATA", "False").lower() == "true"
+
+# Канал для объявлений: бот публикует объявление там и копирует его пользователям
+# (ID вида -100... или @username; пусто — рассылка обычными сообщениями)
+ANNOUNCEMENT_CHANNEL_ID = os.getenv("ANNOUNCEMENT_CHANNEL_ID", "").strip() or None
+
+# Настройки для логирования (в продакшене достаточно предупреждений)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")
 
 # Установка уровня логирования
 if LOG_LEVEL == "DEBUG":
@@ -0,0 +1,109 @@
+import copy
+import json
+
+from aiogram.dispatcher.storage import BaseStorage
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage served from memory and persisted to an SQLite table"""
+
+    def __init__(self, pool):
+        """Initialize storage on top of a database connection pool"""
+        self.pool = pool
+        self.data = {}  # (chat, user) -> {'state': ..., 'data': {...}}
+
+    async def load(self):
+        """Create the states table and load the states saved before a restart"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                chat TEXT,
+                user TEXT,
+                state TEXT,
+                data TEXT,
+                PRIMARY KEY (chat, user)
+            )
+            ''')
+            await conn.commit()
+
+            async with conn.execute("SELECT chat, user, state, data FROM fsm_states") as cursor:
+                self.data = {
+                    (row['chat'], row['user']): {'state': row['state'], 'data': json.loads(row['data'])}
+                    for row in await cursor.fetchall()
+                }
+
+    async def close(self):
+        """Forget the in-memory copy; the pool is closed by its owner"""
+        self.data.clear()
+
+    async def wait_closed(self):
+        """Nothing to wait for, the database is closed elsewhere"""
+
+    def resolve_address(self, chat, user):
+        """Get the storage key of a chat and user"""
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        return chat, user
+
+    def _record(self, key):
+        """Get the record of a key, empty if there is none"""
+        return self.data.get(key) or {'state': None, 'data': {}}
+
+    async def _save(self, key, record):
+        """Store a record in memory and in the database, dropping empty ones"""
+        async with self.pool.acquire() as conn:
+            if record['state'] is None and not record['data']:
+                self.data.pop(key, None)
+                await conn.execute("DELETE FROM fsm_states WHERE chat = ? AND user = ?", key)
+            else:
+                self.data[key] = record
+                await conn.execute(
+                    "INSERT INTO fsm_states (chat, user, state, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (chat, user) DO UPDATE SET state = excluded.state, data = excluded.data",
+                    (*key, record['state'], json.dumps(record['data']))
+                )
+            await conn.commit()
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        """Get the current state of a user in a chat"""
+        key = self.resolve_address(chat, user)
+        record = self.data.get(key)
+        return record['state'] if record else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        """Get a copy of the data stored for a user in a chat"""
+        key = self.resolve_address(chat, user)
+        return copy.deepcopy(self._record(key)['data'])
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        """Set the state of a user in a chat"""
+        key = self.resolve_address(chat, user)
+        record = self._record(key)
+        await self._save(key, {'state': self.resolve_state(state), 'data': record['data']})
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        """Replace the data stored for a user in a chat"""
+        key = self.resolve_address(chat, user)
+        record = self._record(key)
+        await self._save(key, {'state': record['state'], 'data': copy.deepcopy(data or {})})
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        """Merge new values into the data stored for a user in a chat"""
+        key = self.resolve_address(chat, user)
+        record = self._record(key)
+        new_data = copy.deepcopy(record['data'])
+        new_data.update(data or {}, **kwargs)
+        await self._save(key, {'state': record['state'], 'data': new_data})
+
+    async def set_state_with_data(self, *, chat=None, user=None, state=None, data=None):
+        """Set the state of a user in a chat and merge new values into its data in one write"""
+        key = self.resolve_address(chat, user)
+        record = self._record(key)
+        new_data = copy.deepcopy(record['data'])
+        new_data.update(data or {})
+        await self._save(key, {'state': self.resolve_state(state), 'data': new_data})
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        """Clear the state of a user in a chat, and the data unless asked not to"""
+        key = self.resolve_address(chat, user)
+        record = self._record(key)
+        await self._save(key, {'state': None, 'data': {} if with_data else record['data']})
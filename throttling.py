@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+# Telegram allows ~30 messages per second overall and ~1 per second per chat
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """Initialize a bucket refilled with `rate` tokens per second"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """Add the tokens accumulated since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        self._refill()
+        self.tokens -= 1
+
+        # A negative balance means the token is borrowed from the future
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def is_idle(self):
+        """Check if the bucket is full, i.e. nobody used it recently"""
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class OutboundLimiter:
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 max_retries=MAX_RETRIES):
+        """Initialize global and per-chat rate limits for outgoing requests"""
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+
+    def _chat_bucket(self, chat_id):
+        """Get the token bucket of a chat, creating it if needed"""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Forget chats that have been quiet long enough to refill completely
+            if len(self._chat_buckets) >= 10000:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_idle()
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def wait(self, chat_id=None):
+        """Wait until a request to the given chat fits into the rate limits"""
+        delay = self.global_bucket.reserve()
+        if chat_id is not None:
+            delay = max(delay, self._chat_bucket(chat_id).reserve())
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def call(self, chat_id, func, *args, **kwargs):
+        """Call a Bot API coroutine within the rate limits, retrying on flood control"""
+        for attempt in range(self.max_retries + 1):
+            await self.wait(chat_id)
+            try:
+                return await func(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"Flood control hit for chat {chat_id}, retrying in {e.timeout} s")
+                await asyncio.sleep(e.timeout)
+
+
+class LimitedBot(Bot):
+    def __init__(self, *args, limiter=None, **kwargs):
+        """Initialize a bot whose API requests all pass through an OutboundLimiter"""
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or OutboundLimiter()
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        """Make a Bot API request within the outgoing rate limits"""
+        chat_id = data.get('chat_id') if data else None
+        return await self.limiter.call(chat_id, super().request, method, data, files, **kwargs)